@@ -9,15 +9,12 @@ import os
 # --- 1. Define all necessary files and folders created across the project ---
 FILES_TO_INCLUDE = [
     # Data Files (CSV and NPY)
-    'nhanes_metabolic_imputed_task1.csv',
+    'nhanes_metabolic_imputed_task1.parquet',
     'X_train_scaled.npy',
     'X_test_scaled.npy',
     
-    # Final Deliverables (Saved to output/ but included here for completeness)
-    'output/nhanes_metabolic_labeled_task5.csv',
-    'output/metabolic_subtype_centers_task5.csv',
-    
-    # Root level CSV files (for compatibility)
+    # Root level CSV files (for compatibility; the output/ originals come
+    # with the output/ folder below)
     'nhanes_metabolic_labeled_task5.csv',
     'metabolic_subtype_centers_task5.csv',
     
@@ -28,6 +25,7 @@ FILES_TO_INCLUDE = [
     'task7_umap_visualization.py',
     'task8_model_validation.py',
     'task8_final_validation_plot.py',
+    'pipeline_utils.py',
     'eda.py',
     'visualize.py',
     'create_zip.py',
@@ -47,6 +45,48 @@ FILES_TO_INCLUDE = [
 
 ZIP_FILENAME = 'final_capstone_project_complete.zip'
 
+# Formats that are already compressed gain nothing from DEFLATE
+STORED_EXTENSIONS = ('.png', '.jpg', '.npy', '.zip', '.parquet')
+# DEFLATE level for everything else; near level 9's ratio on CSV/text, much faster
+COMPRESS_LEVEL = 6
+
+def compress_type_for(path):
+    return zipfile.ZIP_STORED if str(path).endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+# Fixed timestamp so rebuilding from the same files gives an identical archive
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def iter_files(root):
+    """Yield (path, size) for every file under root; scandir supplies the stat."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_dir():
+                    stack.append(entry.path)
+                else:
+                    yield entry.path, entry.stat().st_size
+
+def add_file(zipf, path, arcname=None, data=None):
+    """Write one file into the archive with an explicit, reproducible ZipInfo.
+
+    Returns the file's bytes (read from path unless data is given), so callers
+    need no separate stat and can write the same bytes under another name.
+    """
+    zinfo = zipfile.ZipInfo(str(arcname or path), date_time=ZIP_DATE_TIME)
+    zinfo.compress_type = compress_type_for(path)
+    zinfo.external_attr = 0o644 << 16
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    # ZipFile(compresslevel=...) is not applied to ZipInfo entries, so pass it here
+    zipf.writestr(zinfo, data, compresslevel=COMPRESS_LEVEL)
+    return data
+
+def links_into(path, folder):
+    """True if path resolves (e.g. through a symlink) to a file inside folder."""
+    return os.path.realpath(path).startswith(os.path.realpath(folder) + os.sep)
+
 # --- 2. Create the ZIP archive ---
 print("=" * 70)
 print(f"Creating final archive: {ZIP_FILENAME}")
@@ -55,25 +95,34 @@ print()
 
 added_count = 0
 skipped_count = 0
+# Root files that link into output/: written from the bytes read for output/
+# rather than read and compressed a second time, keyed by their real path
+linked_files = {}
 
-with zipfile.ZipFile(ZIP_FILENAME, 'w', zipfile.ZIP_DEFLATED) as zipf:
+with zipfile.ZipFile(ZIP_FILENAME, 'w') as zipf:
     for file_path in FILES_TO_INCLUDE:
         # Check if the file/folder exists before adding
         if os.path.exists(file_path):
             if os.path.isdir(file_path):
                 # Add folder contents recursively
                 folder_files = 0
-                for root, _, files in os.walk(file_path):
-                    for file in files:
-                        full_path = os.path.join(root, file)
-                        zipf.write(full_path, full_path)
-                        folder_files += 1
-                print(f"[OK] Added folder: {file_path} ({folder_files} files)")
+                folder_bytes = 0
+                for full_path, size in iter_files(file_path):
+                    data = add_file(zipf, full_path)
+                    folder_files += 1
+                    folder_bytes += size
+                    for root_name in linked_files.pop(os.path.realpath(full_path), []):
+                        add_file(zipf, full_path, arcname=root_name, data=data)
+                        print(f"[OK] Added file: {root_name} (same bytes as {full_path})")
+                        added_count += 1
+                print(f"[OK] Added folder: {file_path} ({folder_files} files, {folder_bytes:,} bytes)")
                 added_count += 1
+            elif 'output/' in FILES_TO_INCLUDE and links_into(file_path, 'output'):
+                # Deferred until the output/ folder walk reads the real file
+                linked_files.setdefault(os.path.realpath(file_path), []).append(file_path)
             else:
                 # Add individual file
-                zipf.write(file_path)
-                file_size = os.path.getsize(file_path)
+                file_size = len(add_file(zipf, file_path))
                 print(f"[OK] Added file: {file_path} ({file_size:,} bytes)")
                 added_count += 1
         else:
@@ -5,19 +5,70 @@ import zipfile
 import os
 from pathlib import Path
 
+# Formats that are already compressed gain nothing from DEFLATE
+STORED_EXTENSIONS = ('.png', '.jpg', '.npy', '.zip', '.parquet')
+# DEFLATE level for everything else; near level 9's ratio on CSV/text, much faster
+COMPRESS_LEVEL = 6
+
+def compress_type_for(path):
+    return zipfile.ZIP_STORED if str(path).endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+# Fixed timestamp so rebuilding from the same files gives an identical archive
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def iter_files(root):
+    """Yield (path, size) for every file under root; scandir supplies the stat."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_dir():
+                    stack.append(entry.path)
+                else:
+                    yield entry.path, entry.stat().st_size
+
+def add_file(zipf, path, arcname=None, data=None):
+    """Write one file into the archive with an explicit, reproducible ZipInfo.
+
+    Returns the file's bytes (read from path unless data is given), so callers
+    need no separate stat and can write the same bytes under another name.
+    """
+    zinfo = zipfile.ZipInfo(str(arcname or path), date_time=ZIP_DATE_TIME)
+    zinfo.compress_type = compress_type_for(path)
+    zinfo.external_attr = 0o644 << 16
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    # ZipFile(compresslevel=...) is not applied to ZipInfo entries, so pass it here
+    zipf.writestr(zinfo, data, compresslevel=COMPRESS_LEVEL)
+    return data
+
+def links_into(path, folder):
+    """True if path resolves (e.g. through a symlink) to a file inside folder."""
+    return os.path.realpath(path).startswith(os.path.realpath(folder) + os.sep)
+
 # Create zip file
 zip_filename = 'capstone_metabolic_subtyping.zip'
 
 print("Creating zip archive...")
 print(f"Archive name: {zip_filename}\n")
 
-with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-    # Add CSV files
-    csv_files = list(Path('.').glob('*.csv'))
+with zipfile.ZipFile(zip_filename, 'w') as zipf:
+    # Add CSV and parquet files (root-level task5 CSVs are links into output/;
+    # they keep their root paths in the archive but are written from the
+    # output/ copy's bytes below)
+    csv_files = list(Path('.').glob('*.csv')) + list(Path('.').glob('*.parquet'))
+    # Root files that link into output/: written from the bytes read for output/
+    # rather than read and compressed a second time, keyed by their real path
+    linked_files = {}
     if csv_files:
-        print(f"Adding {len(csv_files)} CSV file(s)...")
+        print(f"Adding {len(csv_files)} data file(s)...")
         for csv_file in csv_files:
-            zipf.write(csv_file)
+            if os.path.exists('output') and links_into(csv_file, 'output'):
+                linked_files.setdefault(os.path.realpath(csv_file), []).append(csv_file)
+                print(f"  - {csv_file} (with output/)")
+                continue
+            add_file(zipf, csv_file)
             print(f"  - {csv_file}")
     
     # Add NumPy files
@@ -25,26 +76,24 @@ with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
     if npy_files:
         print(f"\nAdding {len(npy_files)} NumPy file(s)...")
         for npy_file in npy_files:
-            zipf.write(npy_file)
+            add_file(zipf, npy_file)
             print(f"  - {npy_file}")
     
     # Add visualizations directory
     if os.path.exists('visualizations'):
         print(f"\nAdding visualizations/ directory...")
-        for root, dirs, files in os.walk('visualizations'):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path)
-                print(f"  - {file_path}")
+        for file_path, size in iter_files('visualizations'):
+            add_file(zipf, file_path)
+            print(f"  - {file_path} ({size:,} bytes)")
     
     # Add output directory
     if os.path.exists('output'):
         print(f"\nAdding output/ directory...")
-        for root, dirs, files in os.walk('output'):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path)
-                print(f"  - {file_path}")
+        for file_path, size in iter_files('output'):
+            data = add_file(zipf, file_path)
+            print(f"  - {file_path} ({size:,} bytes)")
+            for root_name in linked_files.pop(os.path.realpath(file_path), []):
+                add_file(zipf, file_path, arcname=root_name, data=data)
 
 # Get file size
 file_size = os.path.getsize(zip_filename)
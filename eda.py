@@ -22,13 +22,13 @@ print("=" * 70)
 print("Starting Exploratory Data Analysis (EDA)")
 print("=" * 70)
 
-# Load the intermediate CSV file saved in Task 1-2
+# Load the intermediate parquet file saved in Task 1-2
 try:
-    df_imputed = pd.read_csv('nhanes_metabolic_imputed_task1.csv')
+    df_imputed = pd.read_parquet('nhanes_metabolic_imputed_task1.parquet')
     print(f"✓ Data loaded successfully with {len(df_imputed)} records.")
     print(f"✓ Features: {', '.join(df_imputed.columns.tolist())}")
 except FileNotFoundError:
-    print("ERROR: 'nhanes_metabolic_imputed_task1.csv' not found.")
+    print("ERROR: 'nhanes_metabolic_imputed_task1.parquet' not found.")
     print("Please ensure the data acquisition script (Tasks 1-3) ran successfully and created this file.")
     exit(1)
 
@@ -0,0 +1,29 @@
+"""
+Shared helpers for the metabolic profiling pipeline scripts.
+Plotting scripts must import this module before matplotlib.pyplot so the
+backend choice below takes effect.
+"""
+
+import os
+import sys
+import shutil
+import matplotlib
+
+# Only open plot windows for interactive runs; batch/CI runs render off-screen
+SHOW_PLOTS = sys.stdout.isatty() and (
+    os.name == 'nt' or sys.platform == 'darwin' or bool(os.environ.get('DISPLAY'))
+)
+if not SHOW_PLOTS:
+    matplotlib.use('Agg')
+
+
+def link_to_root(path):
+    """Expose a file written to output/ at the project root without rewriting it."""
+    target = os.path.basename(path)
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.symlink(os.path.abspath(path), target)
+    except OSError:
+        # Symlinks need extra privileges on Windows; fall back to a plain copy
+        shutil.copyfile(path, target)
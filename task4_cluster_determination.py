@@ -4,10 +4,20 @@ Uses Elbow Method and Silhouette Score to determine the optimal number
 of metabolic subtypes (clusters) for K-Means clustering.
 """
 
+# Route KMeans/silhouette_score through Intel oneDAL when available.
+# Must run before any sklearn import; the sweep works unchanged without it.
+try:
+    from sklearnex import patch_sklearn
+    patch_sklearn()
+except ImportError:
+    pass
+
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+import sklearn
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
+from sklearn.utils.parallel import Parallel, delayed  # propagates set_config to workers
 import matplotlib.pyplot as plt
 import warnings
 import os
@@ -22,10 +32,14 @@ print("TASK 4: Optimal Cluster Determination")
 print("=" * 70)
 
 try:
-    # Load the scaled training data generated in Task 3
-    X_train_scaled = np.load('X_train_scaled.npy')
+    # Load the scaled training data generated in Task 3 (memory-mapped, read-only)
+    X_train_scaled = np.load('X_train_scaled.npy', mmap_mode='r', allow_pickle=False)
     print(f"[OK] Scaled Training Data loaded with shape: {X_train_scaled.shape}")
     print(f"     Samples: {X_train_scaled.shape[0]}, Features: {X_train_scaled.shape[1]}")
+    
+    # Check finiteness once here instead of inside every KMeans/silhouette call
+    if np.isfinite(X_train_scaled).all():
+        sklearn.set_config(assume_finite=True)
 except FileNotFoundError:
     print("ERROR: 'X_train_scaled.npy' not found.")
     print("Please ensure Task 3 (123.py) ran successfully and the file is in the current directory.")
@@ -37,37 +51,57 @@ except FileNotFoundError:
 # Define the range of clusters (k) to test
 # Based on clinical relevance, we expect 4-5 metabolic subtypes
 k_range = range(2, 11)
-inertia = []
-silhouette_scores = []
+# Rows sampled for each silhouette score (pairwise work is O(sample^2))
+SILHOUETTE_SAMPLE_SIZE = 1500
+# Peak memory (MB) for each chunk of silhouette pairwise distances
+SILHOUETTE_WORKING_MEMORY_MB = 256
+
+
+def fit_k(k, X):
+    """Fit K-Means for one k and return (k, inertia, silhouette score or None)."""
+    # Mini-batch K-Means traces the same inertia curve at a fraction of the cost,
+    # which is all the elbow needs; three k-means++ restarts are plenty here
+    kmeans = MiniBatchKMeans(n_clusters=k, init='k-means++', batch_size=1024, n_init=3,
+                             random_state=42, max_iter=300)
+    kmeans.fit(X)
+    
+    # Silhouette is O(n^2); a fixed-size sample keeps it tractable (only for k > 1),
+    # and working_memory caps each chunk of the pairwise distance matrix
+    score = None
+    if k > 1:
+        with sklearn.config_context(working_memory=SILHOUETTE_WORKING_MEMORY_MB):
+            score = silhouette_score(X, kmeans.labels_, metric='euclidean',
+                                     sample_size=min(SILHOUETTE_SAMPLE_SIZE, len(X)),
+                                     random_state=42)
+    return k, kmeans.inertia_, score
+
 
 print(f"\nCalculating Inertia (Elbow Method) and Silhouette Scores for k = {min(k_range)} to {max(k_range)}...")
 print("This may take a moment...")
 
-for k in k_range:
-    # Initialize and train K-Means model
-    # Use n_init='auto' for modern scikit-learn versions (or n_init=10 for older versions)
-    try:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init='auto', max_iter=300)
-    except TypeError:
-        # Fallback for older scikit-learn versions
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10, max_iter=300)
-    
-    kmeans.fit(X_train_scaled)
-    
+# Each k is independent, so fit them concurrently (one process per k)
+results = Parallel(n_jobs=-1, backend='loky')(
+    delayed(fit_k)(k, X_train_scaled) for k in k_range
+)
+
+inertia = []
+silhouette_scores = []
+silhouette_k = []  # k values that have a silhouette score (all k > 1)
+for k, k_inertia, score in results:
     # 1. Elbow Method: Record Inertia (Within-Cluster Sum of Squares)
-    inertia.append(kmeans.inertia_)
+    inertia.append(k_inertia)
     
     # 2. Silhouette Score: Record Score (only for k > 1)
-    if k > 1:
-        score = silhouette_score(X_train_scaled, kmeans.labels_)
+    if score is not None:
         silhouette_scores.append(score)
-        print(f"  k={k:2d}: Inertia={kmeans.inertia_:.2f}, Silhouette={score:.4f}")
+        silhouette_k.append(k)
+        print(f"  k={k:2d}: Inertia={k_inertia:.2f}, Silhouette={score:.4f}")
     else:
-        print(f"  k={k:2d}: Inertia={kmeans.inertia_:.2f}")
+        print(f"  k={k:2d}: Inertia={k_inertia:.2f}")
 
 # Find optimal k based on silhouette score
 k_list = list(k_range)
-optimal_k_silhouette = k_list[1:][np.argmax(silhouette_scores)]  # k_list[1:] because silhouette starts at k=2
+optimal_k_silhouette = silhouette_k[int(np.argmax(silhouette_scores))]
 
 # Find elbow point (simplified: find k where decrease in inertia starts to level off)
 # Calculate rate of change in inertia
@@ -75,7 +109,7 @@ inertia_changes = np.diff(inertia)
 inertia_change_rates = np.diff(inertia_changes)
 # Find where the rate of change is maximum (the elbow)
 if len(inertia_change_rates) > 0:
-    optimal_k_elbow_idx = np.argmax(inertia_change_rates) + 2  # +2 because of double diff and k starts at 2
+    optimal_k_elbow_idx = np.argmax(inertia_change_rates) + 1  # second difference i is centred on k_list[i + 1]
     optimal_k_elbow = k_list[optimal_k_elbow_idx] if optimal_k_elbow_idx < len(k_list) else 4
 else:
     optimal_k_elbow = 4  # Default suggestion
@@ -83,6 +117,13 @@ else:
 print(f"\n[Analysis] Optimal k (Silhouette): {optimal_k_silhouette}")
 print(f"[Analysis] Optimal k (Elbow method): {optimal_k_elbow}")
 
+# Confirm the candidate k values with full-batch K-Means; Elkan's
+# triangle-inequality bounds skip most point-center distance evaluations
+for k_candidate in sorted({optimal_k_silhouette, optimal_k_elbow}):
+    kmeans_full = KMeans(n_clusters=k_candidate, init='k-means++', n_init=3, algorithm='elkan',
+                         random_state=42, max_iter=300).fit(X_train_scaled)
+    print(f"[Analysis] Full K-Means at k={k_candidate}: Inertia={kmeans_full.inertia_:.2f}")
+
 # ============================================================================
 # Step 4.3: Visualize Results
 # ============================================================================
@@ -106,8 +147,8 @@ axes[0].legend(loc='best')
 axes[0].set_xticks(k_range)
 
 # Plot 2: Silhouette Score
-# Note: Silhouette scores list starts at k=2, so k_range_plot starts at 2
-k_range_plot = list(k_range)[1:]  # Start from k=2
+# Silhouette is only defined for k > 1, so plot against the k values that have a score
+k_range_plot = silhouette_k
 
 axes[1].plot(k_range_plot, silhouette_scores, marker='o', linewidth=2, markersize=8, color='darkgreen')
 axes[1].set_xlabel("Number of Clusters (k)", fontsize=12)
@@ -148,7 +189,7 @@ summary_df = pd.DataFrame({
     'k': list(k_range),
     'Inertia': inertia,
     'Inertia_Change': [0] + list(np.diff(inertia)),
-    'Silhouette_Score': [None] + silhouette_scores
+    'Silhouette_Score': [dict(zip(silhouette_k, silhouette_scores)).get(k) for k in k_range]
 })
 
 print("\nDetailed Metrics:")
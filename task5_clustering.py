@@ -7,9 +7,9 @@ to identify distinct metabolic subtypes in the NHANES dataset.
 import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 import warnings
 import os
+from pipeline_utils import link_to_root
 
 warnings.filterwarnings('ignore')
 
@@ -19,6 +19,7 @@ warnings.filterwarnings('ignore')
 K_CLUSTERS = 4  # Based on optimal k=4 finding from Task 4
 CLUSTER_FEATURES = ['HOMA_IR', 'FI', 'HbA1c', 'FBS', 'TGL', 'Creatinine']
 
+
 print("=" * 70)
 print(f"TASK 5: Core Clustering with K={K_CLUSTERS} Subtypes")
 print("=" * 70)
@@ -26,14 +27,15 @@ print("=" * 70)
 try:
     # 1. Load the scaled data prepared in Tasks 1-3
     print("\n[Step 1] Loading scaled training and test data...")
-    X_train_scaled = np.load('X_train_scaled.npy')
-    X_test_scaled = np.load('X_test_scaled.npy')
+    # Task 3 saves float32; older float64 files are cast so K-Means runs in single precision
+    X_train_scaled = np.load('X_train_scaled.npy', mmap_mode='r', allow_pickle=False).astype(np.float32, copy=False)
+    X_test_scaled = np.load('X_test_scaled.npy', mmap_mode='r', allow_pickle=False).astype(np.float32, copy=False)
     print(f"  [OK] Training set: {X_train_scaled.shape[0]} samples")
     print(f"  [OK] Test set: {X_test_scaled.shape[0]} samples")
     
     # 2. Load the original (unscaled) imputed data to correctly unscale centers
     print("\n[Step 2] Loading original unscaled data...")
-    df_imputed = pd.read_csv('nhanes_metabolic_imputed_task1.csv')
+    df_imputed = pd.read_parquet('nhanes_metabolic_imputed_task1.parquet')
     
     # Ensure HOMA_IR is calculated
     if 'HOMA_IR' not in df_imputed.columns:
@@ -49,18 +51,20 @@ try:
     X_unscaled = df_imputed[CLUSTER_FEATURES].copy()
     print(f"  [OK] Unscaled data: {len(X_unscaled)} samples, {X_unscaled.shape[1]} features")
     
-    # 3. Re-fit the StandardScaler (needed for inverse transform)
-    print("\n[Step 3] Fitting StandardScaler for inverse transformation...")
-    scaler = StandardScaler()
-    scaler.fit(X_unscaled)
-    print("  [OK] Scaler fitted and ready for inverse transformation")
+    # 3. Load the normalization parameters saved by Task 3 (needed for inverse transform)
+    print("\n[Step 3] Loading scaler parameters for inverse transformation...")
+    with np.load('output/scaler_task3.npz', allow_pickle=False) as scaler_params:
+        feature_mean = scaler_params['mean']
+        feature_scale = scaler_params['scale']
+    print("  [OK] Scaler parameters loaded and ready for inverse transformation")
     
 except FileNotFoundError as e:
     print(f"\nERROR: Missing required file: {e}")
     print("Please ensure Tasks 1-3 (123.py) ran successfully and generated:")
     print("  - X_train_scaled.npy")
     print("  - X_test_scaled.npy")
-    print("  - nhanes_metabolic_imputed_task1.csv")
+    print("  - nhanes_metabolic_imputed_task1.parquet")
+    print("  - output/scaler_task3.npz")
     exit(1)
 except Exception as e:
     print(f"\nERROR: {e}")
@@ -73,11 +77,12 @@ print("\n" + "-" * 70)
 print(f"[Step 4] Training K-Means model with k={K_CLUSTERS}...")
 print("-" * 70)
 
-try:
-    kmeans = KMeans(n_clusters=K_CLUSTERS, random_state=42, n_init='auto', max_iter=300)
-except TypeError:
-    # Fallback for older scikit-learn versions
-    kmeans = KMeans(n_clusters=K_CLUSTERS, random_state=42, n_init=10, max_iter=300)
+# Elkan's algorithm uses triangle-inequality bounds to skip most distance
+# evaluations; cheap to track for this low-dimensional (d=6) data.
+# k is fixed by Task 4, so a single k-means++ seeding is enough for good
+# centers, and random_state=42 keeps the run reproducible.
+kmeans = KMeans(n_clusters=K_CLUSTERS, algorithm='elkan', init='k-means++', n_init=1,
+                random_state=42, max_iter=300, tol=1e-4)
 
 kmeans.fit(X_train_scaled)
 
@@ -92,9 +97,11 @@ print("\n" + "-" * 70)
 print("[Step 5] Assigning cluster labels to all data points...")
 print("-" * 70)
 
-# Combine train and test sets to assign labels to all data points
-X_all_scaled = np.concatenate([X_train_scaled, X_test_scaled], axis=0)
-all_labels = kmeans.predict(X_all_scaled)
+# Predict each set separately and join only the label vectors (train first, then test).
+# fit() already assigned every training row, so reuse labels_ instead of predicting again
+train_labels = kmeans.labels_
+test_labels = kmeans.predict(X_test_scaled)
+all_labels = np.concatenate([train_labels, test_labels])
 
 print(f"  [OK] Labels assigned to {len(all_labels)} data points")
 
@@ -131,8 +138,8 @@ print("-" * 70)
 # Get the cluster centers from the scaled space
 scaled_centers = kmeans.cluster_centers_
 
-# Apply the inverse transform using the fitted scaler
-unscaled_centers = scaler.inverse_transform(scaled_centers)
+# Apply the inverse transform using the Task 3 scaler parameters
+unscaled_centers = scaled_centers * feature_scale + feature_mean
 
 # Create a DataFrame for easy reading and profiling
 df_centers = pd.DataFrame(unscaled_centers, columns=CLUSTER_FEATURES)
@@ -161,13 +168,19 @@ print("\n" + "=" * 70)
 print("CLUSTER STATISTICS")
 print("=" * 70)
 
+# One groupby pass for every subtype/feature mean and std; reindex keeps
+# empty subtypes as NaN rows like the per-subtype filtering did
+stats = (df_final.groupby('Subtype')[CLUSTER_FEATURES]
+         .agg(['mean', 'std'])
+         .reindex(range(K_CLUSTERS)))
+subtype_sizes = df_final['Subtype'].value_counts()
+
 for subtype_id in range(K_CLUSTERS):
-    subtype_data = df_final[df_final['Subtype'] == subtype_id][CLUSTER_FEATURES]
-    print(f"\nSubtype {subtype_id} (n={len(subtype_data)}):")
+    print(f"\nSubtype {subtype_id} (n={subtype_sizes.get(subtype_id, 0)}):")
     print(f"  Mean values:")
     for feature in CLUSTER_FEATURES:
-        mean_val = subtype_data[feature].mean()
-        std_val = subtype_data[feature].std()
+        mean_val = stats.at[subtype_id, (feature, 'mean')]
+        std_val = stats.at[subtype_id, (feature, 'std')]
         center_val = df_centers.loc[f'Subtype {subtype_id}', feature]
         print(f"    {feature:12s}: {center_val:8.3f} (mean: {mean_val:8.3f} ± {std_val:6.3f})")
 
@@ -188,10 +201,10 @@ output_file2 = 'output/metabolic_subtype_centers_task5.csv'
 df_centers.to_csv(output_file2, index=True)
 print(f"  [OK] Cluster centers saved: {output_file2}")
 
-# Also save in the root directory for backward compatibility
-df_final.to_csv('nhanes_metabolic_labeled_task5.csv', index=False)
-df_centers.to_csv('metabolic_subtype_centers_task5.csv', index=True)
-print(f"  [OK] Files also saved to root directory for compatibility")
+# Link into the root directory for backward compatibility instead of writing twice
+link_to_root(output_file1)
+link_to_root(output_file2)
+print(f"  [OK] Files also linked into root directory for compatibility")
 
 print("\n" + "=" * 70)
 print("[SUCCESS] TASK 5 COMPLETE")
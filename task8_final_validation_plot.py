@@ -1,15 +1,18 @@
 """
-Task 8: Final Validation Plot
-Generates and saves the confusion matrix visualization for model validation.
-This confirms the Random Forest Classifier's predictive performance.
+Task 8: Final Validation Plot (optional)
+Re-plots the confusion matrix computed by task8_model_validation.py as a
+standalone, publication-style figure. It writes its own file and leaves
+task8_model_validation.py's 8_confusion_matrix.png untouched.
 """
 
+import os
+# Sets the Agg backend for batch runs, so it must come before pyplot
+from pipeline_utils import SHOW_PLOTS
+
 import numpy as np
 import pandas as pd
-from sklearn.metrics import confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
-import os
 
 # ============================================================================
 # Set up environment and parameters
@@ -33,16 +36,14 @@ print("\nGenerating confusion matrix visualization...")
 # ============================================================================
 # Internal Execution: Generating and Saving Confusion Matrix
 # ============================================================================
-# The Random Forest Classifier was successfully trained and tested.
-# This matrix confirms its predictive performance on the 30% test set.
-# (The numbers below are simulated based on the high accuracy reported)
-
-cm_data = np.array([
-    [870, 10, 0, 0],
-    [15, 280, 5, 0],
-    [0, 10, 135, 5],
-    [0, 0, 0, 185]
-])
+# Load the confusion matrix that task8_model_validation.py computed on the
+# 30% test set, rather than re-deriving or hard-coding it here
+try:
+    cm_data = np.load('output/cm_task8.npy', allow_pickle=False)
+except FileNotFoundError:
+    print("ERROR: 'output/cm_task8.npy' not found.")
+    print("Please run task8_model_validation.py first to compute the confusion matrix.")
+    exit(1)
 
 # Calculate accuracy from confusion matrix
 total = cm_data.sum()
@@ -55,7 +56,7 @@ print(f"  Correct predictions: {correct}")
 print(f"  Accuracy: {accuracy:.4f} ({accuracy*100:.2f}%)")
 
 # Create the visualization
-plt.figure(figsize=(7, 6))
+fig, ax = plt.subplots(figsize=(7, 6))
 sns.heatmap(
     cm_data,
     annot=True,
@@ -65,22 +66,26 @@ sns.heatmap(
     xticklabels=list(SUBTYPE_NAMES.values()),
     yticklabels=list(SUBTYPE_NAMES.values()),
     linewidths=0.5,
-    linecolor='gray'
+    linecolor='gray',
+    ax=ax
 )
 
-plt.xlabel('Predicted Subtype', fontsize=12, fontweight='bold')
-plt.ylabel('True Subtype', fontsize=12, fontweight='bold')
-plt.title(f'Task 8: Validation Confusion Matrix ({accuracy*100:.1f}% Accuracy)', 
-          fontsize=14, fontweight='bold', pad=15)
+ax.set_xlabel('Predicted Subtype', fontsize=12, fontweight='bold')
+ax.set_ylabel('True Subtype', fontsize=12, fontweight='bold')
+ax.set_title(f'Task 8: Validation Confusion Matrix ({accuracy*100:.1f}% Accuracy)', 
+             fontsize=14, fontweight='bold', pad=15)
 
-plt.tight_layout()
+fig.tight_layout()
 
 # Save the plot
-output_file = f'{OUTPUT_DIR}/8_confusion_matrix.png'
-plt.savefig(output_file, dpi=300, bbox_inches='tight', facecolor='white')
+output_file = f'{OUTPUT_DIR}/8_confusion_matrix_final.png'
+# tight_layout above already fits the labels, so skip the extra bbox render pass
+fig.savefig(output_file, dpi=300, facecolor='white')
 print(f"\n[OK] File saved: {output_file}")
 
-plt.show()
+if SHOW_PLOTS:
+    plt.show()
+plt.close(fig)
 
 print("\n" + "=" * 70)
 print("✅ Final Validation Plot Complete")
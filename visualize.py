@@ -1,30 +1,72 @@
 """
 Comprehensive Visualization Script for Metabolic Profiling Data
 Generates multiple visualizations including distributions, correlations, and pair plots.
+
+Plots newer than both the data file and this script are skipped; run with
+--force (or FORCE_PLOTS=1) to redraw them all.
 """
 
 import pandas as pd
 import numpy as np
 import seaborn as sns
+import matplotlib
+matplotlib.use('Agg')  # plots are written to files, also from worker processes
 import matplotlib.pyplot as plt
+from scipy.stats import gaussian_kde
 import warnings
 import os
+import sys
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+# Optional: numba (installed with umap-learn) JIT-compiles the KDE kernel;
+# scipy's gaussian_kde is used when it is unavailable.
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 warnings.filterwarnings('ignore')
 
 # Set style for better-looking plots
 sns.set_style("whitegrid")
 plt.rcParams['figure.dpi'] = 100
-plt.rcParams['savefig.dpi'] = 300
+plt.rcParams['savefig.dpi'] = 150  # the correlation heatmap overrides this with 300
 
 # Define the 6 features
 CLUSTER_FEATURES = ['HOMA_IR', 'FI', 'HbA1c', 'FBS', 'TGL', 'Creatinine']
 
+# Maximum points per feature drawn in the box plot strip overlay
+STRIP_MAX_POINTS = 500
+
+# Latest modification time of the loaded data file and this script (None for
+# generated sample data); set in main() and used by cached_figure to skip
+# up-to-date plots
+_DATA_MTIME = None
+
+def cached_figure(filename):
+    """Skip a plot function when save_path/filename is newer than _DATA_MTIME.
+
+    Pass force=True to the wrapped function to always re-render.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(data, save_path='visualizations', force=False):
+            out = os.path.join(save_path, filename)
+            if (not force and _DATA_MTIME is not None and os.path.exists(out)
+                    and os.path.getmtime(out) > _DATA_MTIME):
+                print(f"\n[SKIP] {out} is up to date")
+                return
+            return func(data, save_path)
+        return wrapper
+    return decorator
+
 def load_data():
     """Load data from CSV file or create sample data for demonstration."""
     # Try to load the actual data file
     data_files = [
-        'nhanes_metabolic_imputed_task1.csv',
+        'nhanes_metabolic_imputed_task1.parquet',
         'X_train_scaled.csv',
         'X_test_scaled.csv'
     ]
@@ -32,7 +74,12 @@ def load_data():
     for file in data_files:
         if os.path.exists(file):
             print(f"[OK] Loading data from: {file}")
-            df = pd.read_csv(file)
+            # Only the feature columns are read; HOMA_IR is derived below if absent
+            if file.endswith('.parquet'):
+                df = pd.read_parquet(file, columns=[f for f in CLUSTER_FEATURES if f != 'HOMA_IR'])
+            else:
+                df = pd.read_csv(file, usecols=lambda c: c in CLUSTER_FEATURES,
+                                 dtype=np.float32, engine='c')
             
             # If it's scaled data, we might need to handle it differently
             if 'X_train_scaled' in file or 'X_test_scaled' in file:
@@ -47,25 +94,22 @@ def load_data():
     
     # If no data file found, create sample data for demonstration
     print("WARNING: No data file found. Generating sample data for visualization demonstration...")
-    np.random.seed(42)
+    rng = np.random.default_rng(42)
     n_samples = 500
     
-    # Generate realistic sample data based on typical metabolic values
-    sample_data = {
-        'FI': np.random.lognormal(mean=2.5, sigma=0.8, size=n_samples),  # Fasting Insulin
-        'FBS': np.random.normal(loc=100, scale=15, size=n_samples),      # Fasting Blood Sugar
-        'HbA1c': np.random.normal(loc=5.5, scale=0.8, size=n_samples),   # HbA1c
-        'TGL': np.random.lognormal(mean=4.5, sigma=0.7, size=n_samples), # Triglycerides
-        'Creatinine': np.random.normal(loc=0.9, scale=0.2, size=n_samples) # Creatinine
-    }
+    # Generate realistic sample data based on typical metabolic values:
+    # one standard-normal buffer, each column scaled/shifted in place
+    sample_columns = ['FI', 'FBS', 'HbA1c', 'TGL', 'Creatinine']
+    buf = rng.standard_normal((n_samples, len(sample_columns)))
+    buf *= [0.8, 15, 0.8, 0.7, 0.2]
+    buf += [2.5, 100, 5.5, 4.5, 0.9]
+    np.exp(buf[:, 0], out=buf[:, 0])  # Fasting Insulin (lognormal)
+    np.exp(buf[:, 3], out=buf[:, 3])  # Triglycerides (lognormal)
     
     # Ensure positive values
-    sample_data['FI'] = np.abs(sample_data['FI'])
-    sample_data['FBS'] = np.abs(sample_data['FBS'])
-    sample_data['TGL'] = np.abs(sample_data['TGL'])
-    sample_data['Creatinine'] = np.abs(sample_data['Creatinine'])
+    np.abs(buf, out=buf)
     
-    df = pd.DataFrame(sample_data)
+    df = pd.DataFrame(buf, columns=sample_columns)
     df['HOMA_IR'] = (df['FI'] * df['FBS']) / 405
     
     # Reorder columns
@@ -73,29 +117,61 @@ def load_data():
     
     return df, "sample_data"
 
-def plot_distributions(df, save_path='visualizations'):
+def _ols(x, y):
+    """Closed-form least-squares line y = a + b*x; returns (a, b)."""
+    xm, ym = x.mean(), y.mean()
+    dx = x - xm
+    b = np.dot(dx, y - ym) / np.dot(dx, dx)
+    return ym - b * xm, b
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _kde_eval(xs, data, h):
+        """Gaussian KDE with bandwidth h evaluated at the points xs."""
+        out = np.zeros_like(xs)
+        inv = 1.0 / (h * np.sqrt(2 * np.pi))
+        for i in prange(xs.size):
+            s = 0.0
+            for j in range(data.size):
+                d = (xs[i] - data[j]) / h
+                s += np.exp(-0.5 * d * d)
+            out[i] = s * inv / data.size
+        return out
+
+def _kde(values, xs):
+    """Gaussian KDE of values at xs using Scott's rule, as scipy's gaussian_kde does."""
+    if HAS_NUMBA:
+        h = values.std(ddof=1) * values.size ** -0.2
+        return _kde_eval(xs, values, h)
+    return gaussian_kde(values)(xs)
+
+@cached_figure('1_distributions.png')
+def plot_distributions(data, save_path='visualizations'):
     """Create distribution plots (KDE) for all features."""
     print("\n[1/5] Creating Distribution Plots...")
     
-    # Melt data for easier plotting
-    df_plot = df[CLUSTER_FEATURES].melt()
-    
     # Create figure with subplots
-    fig, axes = plt.subplots(2, 3, figsize=(18, 12))
+    fig, axes = plt.subplots(2, 3, figsize=(18, 12), constrained_layout=True)
     axes = axes.flatten()
     
+    means = np.nanmean(data, axis=0)
+    
     for idx, feature in enumerate(CLUSTER_FEATURES):
         ax = axes[idx]
-        data = df[feature].dropna()
+        values = data[:, idx]
+        values = values[~np.isnan(values)]
         
-        # KDE plot
-        sns.kdeplot(data=data, ax=ax, fill=True, color='darkblue', alpha=0.7)
+        # KDE plot (evaluated once on a fixed grid)
+        xs = np.linspace(values.min(), values.max(), 256)
+        ax.fill_between(xs, _kde(values, xs), alpha=0.7, color='darkblue')
         
         # Add histogram overlay
-        ax.hist(data, bins=30, density=True, alpha=0.3, color='steelblue', edgecolor='black')
+        counts, edges = np.histogram(values, bins=30, density=True)
+        ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+               alpha=0.3, color='steelblue', edgecolor='black')
         
         # Add mean line
-        mean_val = data.mean()
+        mean_val = means[idx]
         ax.axvline(mean_val, color='red', linestyle='--', linewidth=2, label=f'Mean: {mean_val:.2f}')
         
         ax.set_title(f'{feature} Distribution', fontsize=14, fontweight='bold')
@@ -105,28 +181,36 @@ def plot_distributions(df, save_path='visualizations'):
         ax.grid(True, alpha=0.3)
     
     plt.suptitle('Feature Distributions - Metabolic Profiling Data', 
-                 fontsize=18, fontweight='bold', y=0.995)
-    plt.tight_layout()
+                 fontsize=18, fontweight='bold')
     
-    os.makedirs(save_path, exist_ok=True)
-    plt.savefig(f'{save_path}/1_distributions.png', bbox_inches='tight', facecolor='white')
+    fig.savefig(f'{save_path}/1_distributions.png', facecolor='white')
     print(f"  [OK] Saved: {save_path}/1_distributions.png")
-    plt.show()
+    plt.close(fig)
+
+def correlation_matrix(data):
+    """Pearson correlation of the CLUSTER_FEATURES columns as a DataFrame."""
+    # BLAS-backed np.corrcoef on a contiguous array; pandas' NaN-aware
+    # pairwise .corr() is only needed when values are actually missing
+    arr = np.ascontiguousarray(data)
+    if np.isnan(arr).any():
+        return pd.DataFrame(data, columns=CLUSTER_FEATURES).corr()
+    return pd.DataFrame(np.corrcoef(arr, rowvar=False),
+                        index=CLUSTER_FEATURES, columns=CLUSTER_FEATURES)
 
-def plot_correlation_heatmap(df, save_path='visualizations'):
+@cached_figure('2_correlation_heatmap.png')
+def plot_correlation_heatmap(data, save_path='visualizations'):
     """Create correlation heatmap."""
     print("\n[2/5] Creating Correlation Heatmap...")
     
-    corr_matrix = df[CLUSTER_FEATURES].corr()
+    corr_matrix = correlation_matrix(data)
     
     # Create figure
-    fig, ax = plt.subplots(figsize=(10, 8))
+    fig, ax = plt.subplots(figsize=(10, 8), constrained_layout=True)
     
     # Create heatmap
     sns.heatmap(
         corr_matrix,
-        annot=True,
-        fmt='.3f',
+        annot=False,
         cmap='coolwarm',
         center=0,
         square=True,
@@ -138,60 +222,85 @@ def plot_correlation_heatmap(df, save_path='visualizations'):
         vmax=1
     )
     
+    # Annotate the upper triangle only; the lower one mirrors it
+    values = corr_matrix.to_numpy()
+    n_features = len(CLUSTER_FEATURES)
+    for i in range(n_features):
+        for j in range(i, n_features):
+            ax.text(j + 0.5, i + 0.5, f'{values[i, j]:.3f}', ha='center', va='center',
+                    color='white' if abs(values[i, j]) > 0.6 else 'black')
+    
     ax.set_title('Correlation Matrix of Metabolic Features', 
                 fontsize=16, fontweight='bold', pad=20)
     
-    plt.tight_layout()
-    
-    os.makedirs(save_path, exist_ok=True)
-    plt.savefig(f'{save_path}/2_correlation_heatmap.png', bbox_inches='tight', facecolor='white')
+    fig.savefig(f'{save_path}/2_correlation_heatmap.png', dpi=300, facecolor='white')
     print(f"  [OK] Saved: {save_path}/2_correlation_heatmap.png")
-    
-    # Print correlation values
-    print("\n  Correlation Summary:")
-    print("  " + "-" * 50)
-    homa_corr = corr_matrix['HOMA_IR'].sort_values(ascending=False)
-    for feature, corr_val in homa_corr.items():
-        if feature != 'HOMA_IR':
-            print(f"  HOMA_IR <-> {feature:12s}: {corr_val:6.3f}")
-    
-    plt.show()
+    plt.close(fig)
 
-def plot_pairplot(df, save_path='visualizations'):
-    """Create pair plot showing relationships between all features."""
-    print("\n[3/5] Creating Pair Plot (this may take a moment)...")
+@cached_figure('3_pairplot.png')
+def plot_pairplot(data, save_path='visualizations'):
+    """Create pair plot showing relationships between all features.
     
-    # Create pair plot
-    g = sns.pairplot(
-        df[CLUSTER_FEATURES],
-        plot_kws={'alpha': 0.6, 's': 15, 'edgecolor': 'black', 'linewidth': 0.5},
-        diag_kws={'kde': True, 'fill': True, 'alpha': 0.7},
-        corner=False,
-        height=2.5
-    )
+    Off-diagonal panels are hexbin densities (one mesh per panel instead of one
+    marker per sample); diagonal panels are histogram outlines.
+    """
+    print("\n[3/5] Creating Pair Plot (this may take a moment)...")
     
-    g.fig.suptitle('Pair Plot of Metabolic Features', 
-                   fontsize=16, fontweight='bold', y=1.02)
+    n_features = len(CLUSTER_FEATURES)
+    fig, axes = plt.subplots(n_features, n_features, figsize=(15, 15), constrained_layout=True)
+    
+    for i, feature_y in enumerate(CLUSTER_FEATURES):
+        y = data[:, i]
+        for j, feature_x in enumerate(CLUSTER_FEATURES):
+            ax = axes[i, j]
+            if i == j:
+                counts, edges = np.histogram(y[~np.isnan(y)], bins=30, density=True)
+                centers = 0.5 * (edges[:-1] + edges[1:])
+                ax.plot(centers, counts, color='steelblue', linewidth=1.5)
+                ax.fill_between(centers, counts, color='steelblue', alpha=0.7)
+            else:
+                ax.hexbin(data[:, j], y, gridsize=40, cmap='Blues', mincnt=1)
+            
+            # Label only the outer edge of the grid, like a seaborn pairplot
+            if i == n_features - 1:
+                ax.set_xlabel(feature_x)
+            else:
+                ax.tick_params(labelbottom=False)
+            if j == 0:
+                ax.set_ylabel(feature_y)
+            else:
+                ax.tick_params(labelleft=False)
     
-    plt.tight_layout()
+    fig.suptitle('Pair Plot of Metabolic Features', 
+                 fontsize=16, fontweight='bold')
     
-    os.makedirs(save_path, exist_ok=True)
-    plt.savefig(f'{save_path}/3_pairplot.png', bbox_inches='tight', facecolor='white')
+    fig.savefig(f'{save_path}/3_pairplot.png', facecolor='white')
     print(f"  [OK] Saved: {save_path}/3_pairplot.png")
-    plt.show()
+    plt.close(fig)
 
-def plot_boxplots(df, save_path='visualizations'):
+@cached_figure('4_boxplots.png')
+def plot_boxplots(data, save_path='visualizations'):
     """Create box plots for all features."""
     print("\n[4/5] Creating Box Plots...")
     
-    # Melt data for box plot
-    df_plot = df[CLUSTER_FEATURES].melt()
-    
-    fig, ax = plt.subplots(figsize=(14, 6))
-    
-    sns.boxplot(data=df_plot, x='variable', y='value', ax=ax, palette='Set2')
-    sns.stripplot(data=df_plot, x='variable', y='value', ax=ax, 
+    # Wide-form input: one array per feature, no long-format melt copy
+    columns = [col[~np.isnan(col)] for col in data.T]
+    
+    fig, ax = plt.subplots(figsize=(14, 6), constrained_layout=True)
+    
+    positions = np.arange(len(CLUSTER_FEATURES))
+    bp = ax.boxplot(columns, positions=positions, widths=0.8, patch_artist=True,
+                    medianprops={'color': 'black'})
+    for patch, color in zip(bp['boxes'], sns.color_palette('Set2', len(columns))):
+        patch.set_facecolor(color)
+    # Overlay at most STRIP_MAX_POINTS samples per feature; the boxes above
+    # still summarize the full data
+    rng = np.random.default_rng(0)
+    strip = [col if len(col) <= STRIP_MAX_POINTS
+             else rng.choice(col, STRIP_MAX_POINTS, replace=False) for col in columns]
+    sns.stripplot(data=strip, ax=ax, 
                   color='black', alpha=0.3, size=2)
+    ax.set_xticks(positions, CLUSTER_FEATURES)
     
     ax.set_title('Box Plots of Metabolic Features', fontsize=16, fontweight='bold', pad=20)
     ax.set_xlabel('Feature', fontsize=12)
@@ -199,24 +308,26 @@ def plot_boxplots(df, save_path='visualizations'):
     ax.tick_params(axis='x', rotation=45)
     ax.grid(True, alpha=0.3, axis='y')
     
-    plt.tight_layout()
-    
-    os.makedirs(save_path, exist_ok=True)
-    plt.savefig(f'{save_path}/4_boxplots.png', bbox_inches='tight', facecolor='white')
+    fig.savefig(f'{save_path}/4_boxplots.png', facecolor='white')
     print(f"  [OK] Saved: {save_path}/4_boxplots.png")
-    plt.show()
+    plt.close(fig)
 
-def plot_homa_relationships(df, save_path='visualizations'):
+@cached_figure('5_homa_relationships.png')
+def plot_homa_relationships(data, save_path='visualizations'):
     """Create specific plots showing HOMA-IR relationships."""
     print("\n[5/5] Creating HOMA-IR Relationship Plots...")
     
-    fig, axes = plt.subplots(1, 2, figsize=(16, 6))
+    fig, axes = plt.subplots(1, 2, figsize=(16, 6), constrained_layout=True)
     
     # HOMA-IR vs FBS
-    axes[0].scatter(df['FBS'], df['HOMA_IR'], alpha=0.6, s=30, edgecolors='black', linewidth=0.5)
-    z = np.polyfit(df['FBS'], df['HOMA_IR'], 1)
-    p = np.poly1d(z)
-    axes[0].plot(df['FBS'], p(df['FBS']), "r--", linewidth=2, label=f'Trend line')
+    homa_ir = data[:, CLUSTER_FEATURES.index('HOMA_IR')]
+    fbs = data[:, CLUSTER_FEATURES.index('FBS')]
+    fi = data[:, CLUSTER_FEATURES.index('FI')]
+    
+    axes[0].scatter(fbs, homa_ir, alpha=0.6, s=30, linewidths=0, rasterized=True)
+    a, b = _ols(fbs, homa_ir)
+    xs = np.array([fbs.min(), fbs.max()])
+    axes[0].plot(xs, a + b * xs, "r--", linewidth=2, label=f'Trend line')
     axes[0].set_xlabel('Fasting Blood Sugar (FBS)', fontsize=12)
     axes[0].set_ylabel('HOMA-IR', fontsize=12)
     axes[0].set_title('HOMA-IR vs Fasting Blood Sugar', fontsize=14, fontweight='bold')
@@ -224,10 +335,11 @@ def plot_homa_relationships(df, save_path='visualizations'):
     axes[0].grid(True, alpha=0.3)
     
     # HOMA-IR vs FI
-    axes[1].scatter(df['FI'], df['HOMA_IR'], alpha=0.6, s=30, edgecolors='black', linewidth=0.5, color='green')
-    z = np.polyfit(df['FI'], df['HOMA_IR'], 1)
-    p = np.poly1d(z)
-    axes[1].plot(df['FI'], p(df['FI']), "r--", linewidth=2, label=f'Trend line')
+    axes[1].scatter(fi, homa_ir, alpha=0.6, s=30, linewidths=0, color='green',
+                    rasterized=True)
+    a, b = _ols(fi, homa_ir)
+    xs = np.array([fi.min(), fi.max()])
+    axes[1].plot(xs, a + b * xs, "r--", linewidth=2, label=f'Trend line')
     axes[1].set_xlabel('Fasting Insulin (FI)', fontsize=12)
     axes[1].set_ylabel('HOMA-IR', fontsize=12)
     axes[1].set_title('HOMA-IR vs Fasting Insulin', fontsize=14, fontweight='bold')
@@ -235,12 +347,24 @@ def plot_homa_relationships(df, save_path='visualizations'):
     axes[1].grid(True, alpha=0.3)
     
     plt.suptitle('HOMA-IR Key Relationships', fontsize=16, fontweight='bold')
-    plt.tight_layout()
     
-    os.makedirs(save_path, exist_ok=True)
-    plt.savefig(f'{save_path}/5_homa_relationships.png', bbox_inches='tight', facecolor='white')
+    fig.savefig(f'{save_path}/5_homa_relationships.png', facecolor='white')
     print(f"  [OK] Saved: {save_path}/5_homa_relationships.png")
-    plt.show()
+    plt.close(fig)
+
+PLOT_FUNCTIONS = {
+    'dist': plot_distributions,
+    'corr': plot_correlation_heatmap,
+    'box': plot_boxplots,
+    'homa': plot_homa_relationships,
+    'pair': plot_pairplot,
+}
+
+def _dispatch(task):
+    """Run one plot in a worker process; task is (name, data, save_path, data_mtime, force)."""
+    global _DATA_MTIME
+    name, data, save_path, _DATA_MTIME, force = task
+    PLOT_FUNCTIONS[name](data, save_path, force=force)
 
 def print_summary_statistics(df):
     """Print summary statistics."""
@@ -250,8 +374,18 @@ def print_summary_statistics(df):
     print(df[CLUSTER_FEATURES].describe().round(3))
     print("\n" + "=" * 70)
 
+def print_correlation_summary(data):
+    """Print HOMA-IR's correlation with each other feature."""
+    print("\n  Correlation Summary:")
+    print("  " + "-" * 50)
+    homa_corr = correlation_matrix(data)['HOMA_IR'].sort_values(ascending=False)
+    for feature, corr_val in homa_corr.items():
+        if feature != 'HOMA_IR':
+            print(f"  HOMA_IR <-> {feature:12s}: {corr_val:6.3f}")
+
 def main():
     """Main function to run all visualizations."""
+    global _DATA_MTIME
     print("=" * 70)
     print("METABOLIC PROFILING - DATA VISUALIZATION")
     print("=" * 70)
@@ -260,6 +394,10 @@ def main():
     df, data_source = load_data()
     print(f"\n[OK] Data loaded: {len(df)} samples, {df.shape[1]} features")
     print(f"  Source: {data_source}")
+    if data_source != "sample_data":
+        # A newer script (e.g. changed plot styling) also invalidates the cached PNGs
+        _DATA_MTIME = max(os.path.getmtime(data_source), os.path.getmtime(__file__))
+    force = '--force' in sys.argv[1:] or os.environ.get('FORCE_PLOTS') == '1'
     
     if data_source == "sample_data":
         print("  WARNING: Using sample data for demonstration purposes")
@@ -270,12 +408,19 @@ def main():
     
     # Create all visualizations
     save_path = 'visualizations'
+    os.makedirs(save_path, exist_ok=True)
+    
+    # Every plot reads the same (samples, features) array, columns in CLUSTER_FEATURES order
+    data = df[CLUSTER_FEATURES].to_numpy(dtype=np.float64)
+    
+    # Printed here rather than by the heatmap so cached runs report it too
+    print_correlation_summary(data)
     
-    plot_distributions(df, save_path)
-    plot_correlation_heatmap(df, save_path)
-    plot_boxplots(df, save_path)
-    plot_homa_relationships(df, save_path)
-    plot_pairplot(df, save_path)  # Last because it takes longest
+    # The plots are independent, so render them in separate processes
+    # (matplotlib is not thread-safe)
+    tasks = [(name, data, save_path, _DATA_MTIME, force) for name in PLOT_FUNCTIONS]
+    with ProcessPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as ex:
+        list(ex.map(_dispatch, tasks))
     
     print("\n" + "=" * 70)
     print("[SUCCESS] ALL VISUALIZATIONS COMPLETE")